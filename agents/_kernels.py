@@ -0,0 +1,194 @@
+"""
+Numeric Kernels Module.
+
+Batch arithmetic for HealthAgent.analyze_users_bulk (BMI, BMR, TDEE,
+adjusted calories and macros) and NutritionAgent's closest-calorie side picker.
+When Numba is installed the loops are JIT-compiled; otherwise equivalent
+vectorized NumPy implementations are used. Both take the same arguments and
+return the same arrays.
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:  # Optional JIT: NumPy path is used instead
+    NUMBA_AVAILABLE = False
+
+# Row positions shared with HealthAgent (Gender.MALE first, BMI "Underweight" first)
+MALE_ID = 0
+UNDERWEIGHT_ID = 0
+NORMAL_ID = 1
+
+# Veltkamp splitter for float64: x * _SPLIT separates x into two 26-bit halves
+_SPLIT = 134217729.0  # 2 ** 27 + 1
+
+
+def _round2_scalar(x):
+    """
+    round(x, 2) exactly as Python computes it. np.round (and Numba's round)
+    take rint(x * 100), which misrounds when that product lands on a .5 tie
+    only because of its own rounding error; the exact error breaks the tie.
+    """
+    p = x * 100.0
+    y = np.rint(p)
+    if abs(p - y) == 0.5:
+        c = _SPLIT * x
+        hi = c - (c - x)
+        err = (hi * 100.0 - p) + (x - hi) * 100.0
+        if err > 0:
+            y = np.ceil(p)
+        elif err < 0:
+            y = np.floor(p)
+    return y / 100.0
+
+
+def _round2_array(x):
+    """Vectorized _round2_scalar for the NumPy fallback."""
+    p = x * 100.0
+    y = np.rint(p)
+    c = _SPLIT * x
+    hi = c - (c - x)
+    err = (hi * 100.0 - p) + (x - hi) * 100.0
+    tie = np.abs(p - y) == 0.5
+    y = np.where(tie & (err > 0), np.ceil(p), np.where(tie & (err < 0), np.floor(p), y))
+    return y / 100.0
+
+
+# Compiled up front so the Numba loop below can call it
+_round2 = njit(cache=True)(_round2_scalar) if NUMBA_AVAILABLE else _round2_scalar
+
+
+def _analyze_batch_loop(weights, heights, ages, gender_ids, activity_ids, goal_ids,
+                        activity_mult, cal_mult, macro_div):
+    """Per-user loop compiled by Numba; mirrors HealthAgent.analyze_user exactly."""
+    n = weights.shape[0]
+    bmi = np.zeros(n, dtype=np.float64)
+    bmi_ids = np.empty(n, dtype=np.int64)
+    bmr = np.empty(n, dtype=np.int64)
+    tdee = np.empty(n, dtype=np.int64)
+    calories = np.empty(n, dtype=np.int64)
+    protein = np.empty(n, dtype=np.int64)
+    carbs = np.empty(n, dtype=np.int64)
+    fats = np.empty(n, dtype=np.int64)
+
+    for i in prange(n):
+        w = weights[i]
+        h = heights[i]
+        a = ages[i]
+
+        # BMI (invalid biometrics fall back to 0 / "Normal")
+        b_id = NORMAL_ID
+        if w > 0 and h > 0:
+            h_m = h / 100
+            b = _round2(w / (h_m ** 2))
+            bmi[i] = b
+            if b < 18.5:
+                b_id = 0
+            elif b < 25:
+                b_id = 1
+            elif b < 30:
+                b_id = 2
+            else:
+                b_id = 3
+        bmi_ids[i] = b_id
+
+        # BMR (Mifflin-St Jeor) / TDEE
+        base = (10 * w) + (6.25 * h) - (5 * a)
+        bmr_i = int(base + 5 if gender_ids[i] == MALE_ID else base - 161)
+        tdee_i = int(bmr_i * activity_mult[activity_ids[i]])
+        bmr[i] = bmr_i
+        tdee[i] = tdee_i
+
+        # Adjusted calories via the multiplier table (factors applied in rule order)
+        if a > 40:
+            bucket = 2
+        elif 18 <= a <= 25:
+            bucket = 0
+        else:
+            bucket = 1
+        g = goal_ids[i]
+        cal = tdee_i * cal_mult[g, bucket, b_id, 0] * cal_mult[g, bucket, b_id, 1] \
+            * cal_mult[g, bucket, b_id, 2]
+        if b_id == UNDERWEIGHT_ID:
+            cal = max(cal, tdee_i * 1.1)
+        cal_i = int(cal)
+        calories[i] = cal_i
+
+        # Macros (divisors already include kcal per gram)
+        protein[i] = int(cal_i * macro_div[g, 0])
+        carbs[i] = int(cal_i * macro_div[g, 1])
+        fats[i] = int(cal_i * macro_div[g, 2])
+
+    return bmi, bmi_ids, bmr, tdee, calories, protein, carbs, fats
+
+
+def _analyze_batch_numpy(weights, heights, ages, gender_ids, activity_ids, goal_ids,
+                         activity_mult, cal_mult, macro_div):
+    """Vectorized NumPy fallback used when Numba is not installed; mirrors analyze_user exactly."""
+    # BMI (invalid biometrics fall back to 0 / "Normal")
+    valid = (weights > 0) & (heights > 0)
+    height_m = np.where(valid, heights, 1.0) / 100
+    bmi = np.where(valid, _round2_array(weights / height_m ** 2), 0.0)
+    bmi_ids = np.select([bmi < 18.5, bmi < 25, bmi < 30], [0, 1, 2], 3)
+    bmi_ids[~valid] = NORMAL_ID
+
+    # BMR / TDEE
+    base = (10 * weights) + (6.25 * heights) - (5 * ages)
+    bmr = (base + np.where(gender_ids == MALE_ID, 5, -161)).astype(np.int64)
+    tdee = (bmr * activity_mult[activity_ids]).astype(np.int64)
+
+    # Adjusted calories via the multiplier table (factors applied in rule order)
+    buckets = np.where(ages > 40, 2, np.where((ages >= 18) & (ages <= 25), 0, 1))
+    factors = cal_mult[goal_ids, buckets, bmi_ids]
+    calories = tdee * factors[:, 0] * factors[:, 1] * factors[:, 2]
+    calories = np.where(bmi_ids == UNDERWEIGHT_ID, np.maximum(calories, tdee * 1.1), calories)
+    calories = calories.astype(np.int64)
+
+    # Macros (divisors already include kcal per gram)
+    macros = (calories[:, None] * macro_div[goal_ids]).astype(np.int64)
+    protein, carbs, fats = macros[:, 0], macros[:, 1], macros[:, 2]
+
+    return bmi, bmi_ids, bmr, tdee, calories, protein, carbs, fats
+
+
+def _top_k_closest_loop(cals, target, k):
+    """Positions of the k values nearest `target`: one pass into a sorted k-slot buffer."""
+    k = min(k, cals.shape[0])
+    best_idx = np.empty(k, dtype=np.int64)
+    best_diff = np.full(k, np.inf)
+
+    for i in range(cals.shape[0]):
+        d = abs(cals[i] - target)
+        if d < best_diff[k - 1]:
+            j = k - 1
+            while j > 0 and best_diff[j - 1] > d:
+                best_diff[j] = best_diff[j - 1]
+                best_idx[j] = best_idx[j - 1]
+                j -= 1
+            best_diff[j] = d
+            best_idx[j] = i
+
+    return best_idx
+
+
+def _top_k_closest_numpy(cals, target, k):
+    """np.argpartition fallback: O(N) top-k without sorting the candidates."""
+    diff = np.abs(cals - target)
+    k = min(k, diff.size)
+    return np.argpartition(diff, k - 1)[:k]
+
+
+if NUMBA_AVAILABLE:
+    analyze_batch = njit(parallel=True, cache=True)(_analyze_batch_loop)
+    top_k_closest = njit(cache=True)(_top_k_closest_loop)
+else:
+    analyze_batch = _analyze_batch_numpy
+    top_k_closest = _top_k_closest_numpy
+
+logger.debug(f"Numeric kernels backend: {'Numba JIT' if NUMBA_AVAILABLE else 'NumPy'}")
@@ -6,8 +6,15 @@ dynamic nutritional adjustments based on age, BMI, and specific health goals.
 """
 
 import logging
+import itertools
 from enum import Enum
-from typing import Dict, Union, Any
+from functools import lru_cache
+from typing import Dict, Tuple, Union, Any
+
+import numpy as np
+import pandas as pd
+
+from ._kernels import analyze_batch
 
 # Configure module-level logger
 logger = logging.getLogger(__name__)
@@ -29,6 +36,49 @@ class Goal(Enum):
     MAINTENANCE = "maintenance"
     MUSCLE_GAIN = "muscle_gain"
 
+def _build_aliases(enum_class: Enum, extra: Dict[str, Enum] = None) -> Dict[str, Enum]:
+    """Maps every spelling of each member value ('_', ' ' or '-' between words) to the member."""
+    aliases = {}
+    for member in enum_class:
+        words = member.value.split("_")
+        for seps in itertools.product("_ -", repeat=len(words) - 1):
+            aliases[words[0] + "".join(sep + w for sep, w in zip(seps, words[1:]))] = member
+    aliases.update(extra or {})
+    return aliases
+
+# Normalized (stripped, lowercased) input -> Enum member, built once at import
+_ENUM_ALIASES = {
+    Gender: _build_aliases(Gender),
+    ActivityLevel: _build_aliases(ActivityLevel),
+    Goal: _build_aliases(Goal, {"maintain": Goal.MAINTENANCE}),
+}
+
+# ---------- CONSTANT TABLES ----------
+# Multipliers derived from standard nutrition science
+TDEE_MULT = {
+    ActivityLevel.SEDENTARY: 1.2,
+    ActivityLevel.LIGHTLY_ACTIVE: 1.375,
+    ActivityLevel.MODERATELY_ACTIVE: 1.55,
+    ActivityLevel.VERY_ACTIVE: 1.725,
+    ActivityLevel.EXTRA_ACTIVE: 1.9,
+}
+
+# Macro split (Protein, Carbs, Fats) per goal
+MACRO_RATIOS = {
+    Goal.WEIGHT_LOSS: (0.30, 0.40, 0.30),
+    Goal.MUSCLE_GAIN: (0.30, 0.50, 0.20),
+    Goal.MAINTENANCE: (0.25, 0.50, 0.25),
+}
+
+# Ratios pre-divided by kcal per gram (4 P, 4 C, 9 F): grams = calories * divisor
+MACRO_DIV = {
+    goal: (p / 4, c / 4, f / 9) for goal, (p, c, f) in MACRO_RATIOS.items()
+}
+
+# Lookup axes for the adjusted-calorie multiplier table
+AGE_BUCKETS = ("young", "adult", "over40")
+BMI_CATEGORIES = ("Underweight", "Normal", "Overweight", "Obese")
+
 # ---------- AGENT ----------
 class HealthAgent:
     """
@@ -39,21 +89,37 @@ class HealthAgent:
     def __init__(self):
         self.logger = logging.getLogger(f"{__name__}.HealthAgent")
 
+        # Every goal/age/BMI rule as one (goal, age, BMI) factor triple per combination
+        self._cal_mult = {
+            (goal, bucket, bmi_cat): self._rule_multipliers(goal, bucket, bmi_cat)
+            for goal, bucket, bmi_cat in itertools.product(Goal, AGE_BUCKETS, BMI_CATEGORIES)
+        }
+
+        # Dense copies of the tables, indexed by enum position, for the batch kernel
+        self._activity_mult_arr = np.array([TDEE_MULT[a] for a in ActivityLevel])
+        self._macro_div_arr = np.array([MACRO_DIV[g] for g in Goal])
+        self._cal_mult_arr = np.array([
+            [[self._cal_mult[(goal, bucket, bmi_cat)] for bmi_cat in BMI_CATEGORIES]
+             for bucket in AGE_BUCKETS]
+            for goal in Goal
+        ])
+
+        # Per-instance memo: a method-level lru_cache would pin every instance
+        # and share one maxsize across all of them
+        self._analyze_cached = lru_cache(maxsize=1024)(self._analyze_core)
+
     # ---------- UTILITIES ----------
     @staticmethod
     def _normalize_enum(value: Union[str, Enum], enum_class: Enum, default: Enum) -> Enum:
-        """Helper to safely convert strings to Enums."""
+        """Helper to safely convert strings to Enums via the precomputed alias map."""
         if isinstance(value, enum_class):
             return value
-        try:
-            # Clean string: "Weight Loss" -> "weight_loss"
-            clean_val = str(value).lower().strip().replace(" ", "_")
-            # Handle specific aliases if needed
-            if clean_val == "maintain": return Goal.MAINTENANCE
-            return enum_class(clean_val)
-        except (ValueError, AttributeError):
+        # "Weight Loss" / "weight-loss" / "weight_loss" -> Goal.WEIGHT_LOSS
+        member = _ENUM_ALIASES.get(enum_class, {}).get(str(value).strip().lower())
+        if member is None:
             logger.warning(f"Invalid {enum_class.__name__}: {value}. Using default: {default.value}")
             return default
+        return member
 
     # ---------- CORE CALCULATIONS ----------
     def analyze_user(self, user_profile: Dict[str, Any]) -> Dict[str, Any]:
@@ -70,33 +136,24 @@ class HealthAgent:
             activity = self._normalize_enum(user_profile.get('activity_level'), ActivityLevel, ActivityLevel.MODERATELY_ACTIVE)
             goal = self._normalize_enum(user_profile.get('goal'), Goal, Goal.MAINTENANCE)
 
-            # 2. Run Calculations
-            bmi_data = self.calculate_bmi(weight, height)
-            bmr = self.calculate_bmr(weight, height, age, gender)
-            tdee = self.calculate_tdee(bmr, activity)
-            
-            # 3. Calculate Target Calories (Applying Notebook Logic: Age/BMI Rules)
-            target_calories = self.calculate_adjusted_calories(
-                tdee, goal, age, bmi_data['category']
-            )
-
-            # 4. Calculate Macros
-            macros = self.calculate_macros(target_calories, goal)
+            # 2. Run Calculations (memoized on the normalized inputs)
+            bmi, bmi_category, bmr, tdee, target_calories, protein, carbs, fats = \
+                self._analyze_cached(weight, height, age, gender, activity, goal)
 
-            self.logger.info(f"Analyzed user: BMI={bmi_data['bmi']}, Target={target_calories} kcal")
+            self.logger.info(f"Analyzed user: BMI={bmi}, Target={target_calories} kcal")
 
             return {
                 "biometrics": {
-                    "bmi": bmi_data['bmi'],
-                    "bmi_category": bmi_data['category'],
+                    "bmi": bmi,
+                    "bmi_category": bmi_category,
                     "bmr": bmr,
                     "tdee": tdee
                 },
                 "targets": {
                     "calories": target_calories,
-                    "protein": macros['protein_g'],
-                    "carbs": macros['carbs_g'],
-                    "fats": macros['fats_g']
+                    "protein": protein,
+                    "carbs": carbs,
+                    "fats": fats
                 }
             }
 
@@ -104,6 +161,73 @@ class HealthAgent:
             self.logger.error(f"Error in analyze_user: {e}")
             return {}
 
+    def _analyze_core(self, weight: float, height: float, age: int,
+                      gender: Gender, activity: ActivityLevel, goal: Goal) -> Tuple:
+        """
+        Deterministic core of analyze_user, memoized per instance as _analyze_cached.
+        Returns a flat tuple so cached results can never be mutated by callers.
+        """
+        bmi_data = self.calculate_bmi(weight, height)
+        bmr = self.calculate_bmr(weight, height, age, gender)
+        tdee = self.calculate_tdee(bmr, activity)
+
+        # Calculate Target Calories (Applying Notebook Logic: Age/BMI Rules)
+        target_calories = self.calculate_adjusted_calories(
+            tdee, goal, age, bmi_data['category']
+        )
+
+        macros = self.calculate_macros(target_calories, goal)
+
+        return (
+            bmi_data['bmi'], bmi_data['category'], bmr, tdee, target_calories,
+            macros['protein_g'], macros['carbs_g'], macros['fats_g']
+        )
+
+    def analyze_users_bulk(self, profiles: pd.DataFrame) -> pd.DataFrame:
+        """
+        Vectorized analyze_user for many profiles at once (Numba-compiled when
+        available, NumPy otherwise).
+
+        Takes one row per user (same keys as the single-user profile) and returns
+        one row per user with bmi, bmi_category, bmr, tdee, calories, protein,
+        carbs and fats.
+        """
+        def column(name: str, default: Any) -> pd.Series:
+            if name in profiles:
+                return profiles[name]
+            return pd.Series([default] * len(profiles), index=profiles.index)
+
+        def enum_ids(name: str, enum_class: Enum, default: Enum) -> np.ndarray:
+            # Normalize each distinct value once, then map to its position in the enum
+            values = column(name, default.value)
+            members = list(enum_class)
+            lookup = {v: members.index(self._normalize_enum(v, enum_class, default))
+                      for v in values.unique()}
+            return values.map(lookup).to_numpy(np.intp)
+
+        bmi, bmi_id, bmr, tdee, calories, protein, carbs, fats = analyze_batch(
+            column("weight", 0).astype(float).to_numpy(np.float64),
+            column("height", 0).astype(float).to_numpy(np.float64),
+            column("age", 25).astype(int).to_numpy(np.int64),
+            enum_ids("gender", Gender, Gender.MALE),
+            enum_ids("activity_level", ActivityLevel, ActivityLevel.MODERATELY_ACTIVE),
+            enum_ids("goal", Goal, Goal.MAINTENANCE),
+            self._activity_mult_arr,
+            self._cal_mult_arr,
+            self._macro_div_arr,
+        )
+
+        return pd.DataFrame({
+            "bmi": bmi,
+            "bmi_category": np.array(BMI_CATEGORIES)[bmi_id],
+            "bmr": bmr,
+            "tdee": tdee,
+            "calories": calories,
+            "protein": protein,
+            "carbs": carbs,
+            "fats": fats,
+        }, index=profiles.index)
+
     def calculate_bmi(self, weight: float, height_cm: float) -> Dict[str, Union[float, str]]:
         """Calculates BMI and returns score + category."""
         if weight <= 0 or height_cm <= 0:
@@ -127,71 +251,93 @@ class HealthAgent:
 
     def calculate_tdee(self, bmr: int, activity_level: ActivityLevel) -> int:
         """Calculates Total Daily Energy Expenditure based on activity multiplier."""
-        # Multipliers derived from standard nutrition science
-        multipliers = {
-            ActivityLevel.SEDENTARY: 1.2,
-            ActivityLevel.LIGHTLY_ACTIVE: 1.375,
-            ActivityLevel.MODERATELY_ACTIVE: 1.55,
-            ActivityLevel.VERY_ACTIVE: 1.725,
-            ActivityLevel.EXTRA_ACTIVE: 1.9,
-        }
-        return int(bmr * multipliers[activity_level])
+        return int(bmr * TDEE_MULT[activity_level])
 
-    def calculate_adjusted_calories(self, tdee: int, goal: Goal, age: int, bmi_category: str) -> int:
+    @staticmethod
+    def _age_bucket(age: int) -> str:
+        """Maps age onto the buckets used by the age adjustment rules."""
+        if age > 40:
+            return "over40"
+        if 18 <= age <= 25:
+            return "young"
+        return "adult"
+
+    @staticmethod
+    def _rule_multipliers(goal: Goal, age_bucket: str,
+                          bmi_category: str) -> Tuple[float, float, float]:
         """
-        Applies complex logic from the Data Science Notebook:
+        (goal, age, BMI) factors from the Data Science Notebook rules:
         - Goal Multipliers (0.85 for loss, 1.15 for gain)
         - Age Penalties (>40 years old)
-        - BMI Adjustments (Underweight/Obese handling)
+        - BMI Adjustments (Overweight/Obese on weight loss)
+        Kept separate rather than pre-multiplied: folding them into one float
+        rounds differently and shifts some targets by 1 kcal.
+        The Underweight floor is not multiplicative and is applied separately.
         """
-        calories = float(tdee)
-
         # --- 1. Goal Adjustment ---
+        goal_f = 1.0  # Maintenance stays at 1.0
         if goal == Goal.WEIGHT_LOSS:
-            calories *= 0.85  # 15% Deficit
+            goal_f = 0.85  # 15% Deficit
         elif goal == Goal.MUSCLE_GAIN:
-            calories *= 1.15  # 15% Surplus
-        # Maintenance stays at 1.0
+            goal_f = 1.15  # 15% Surplus
 
         # --- 2. Age Adjustment (Logic from Notebook) ---
-        if age > 40:
+        age_f = 1.0
+        if age_bucket == "over40":
             # Metabolism slows down, reduce intake slightly to prevent creep
-            calories *= 0.95
-        elif 18 <= age <= 25 and goal == Goal.MUSCLE_GAIN:
+            age_f = 0.95
+        elif age_bucket == "young" and goal == Goal.MUSCLE_GAIN:
             # Young adults have higher metabolic adaptability
-            calories *= 1.05
+            age_f = 1.05
 
         # --- 3. BMI Adjustment (Logic from Notebook) ---
-        if bmi_category == "Underweight":
-            # If underweight, ensure we aren't restricting, even if goal is maintenance
-            calories = max(calories, tdee * 1.1)
-        elif bmi_category in ["Overweight", "Obese"] and goal == Goal.WEIGHT_LOSS:
+        bmi_f = 1.0
+        if bmi_category in ["Overweight", "Obese"] and goal == Goal.WEIGHT_LOSS:
             # If obese, we can handle a slightly larger deficit safely, but we stick to 
             # the notebook's logic of just ensuring we don't overestimate TDEE.
             # We apply a slight 0.9 correction to be conservative.
-            calories *= 0.95
+            bmi_f = 0.95
+
+        return goal_f, age_f, bmi_f
+
+    def calculate_adjusted_calories(self, tdee: int, goal: Goal, age: int, bmi_category: str) -> int:
+        """
+        Applies complex logic from the Data Science Notebook via the precomputed
+        (goal, age bucket, BMI category) multiplier table: one lookup, with the
+        factors applied in the notebook's order.
+        """
+        bucket = self._age_bucket(age)
+        goal_f, age_f, bmi_f = self._cal_mult.get(
+            (goal, bucket, bmi_category), self._cal_mult[(goal, bucket, "Normal")]
+        )
+        calories = tdee * goal_f * age_f * bmi_f
+
+        if bmi_category == "Underweight":
+            # If underweight, ensure we aren't restricting, even if goal is maintenance
+            calories = max(calories, tdee * 1.1)
 
         return int(calories)
 
     def calculate_macros(self, calories: int, goal: Goal) -> Dict[str, int]:
         """
         Calculates macronutrient split (Protein/Carbs/Fats) based on goal.
-        Ratios derived from the project notebook analysis.
+        Ratios derived from the project notebook analysis:
+        - Weight Loss: High Protein (30%), Moderate Carbs (40%), Moderate Fat (30%)
+        - Muscle Gain: Moderate Protein (30%), High Carbs (50%) for energy, Low Fat (20%)
+        - Maintenance: Balanced: 25% P, 50% C, 25% F
         """
-        if goal == Goal.WEIGHT_LOSS:
-            # High Protein (30%), Moderate Carbs (40%), Moderate Fat (30%)
-            ratios = (0.30, 0.40, 0.30)
-        elif goal == Goal.MUSCLE_GAIN:
-            # Moderate Protein (30%), High Carbs (50%) for energy, Low Fat (20%)
-            ratios = (0.30, 0.50, 0.20)
-        else: # Maintenance
-            # Balanced: 25% P, 50% C, 25% F
-            ratios = (0.25, 0.50, 0.25)
-
-        p_ratio, c_ratio, f_ratio = ratios
+        p_div, c_div, f_div = MACRO_DIV.get(goal, MACRO_DIV[Goal.MAINTENANCE])
 
         return {
-            "protein_g": int((calories * p_ratio) / 4),
-            "carbs_g": int((calories * c_ratio) / 4),
-            "fats_g": int((calories * f_ratio) / 9)
-        }
\ No newline at end of file
+            "protein_g": int(calories * p_div),
+            "carbs_g": int(calories * c_div),
+            "fats_g": int(calories * f_div)
+        }
+
+    def calculate_macros_bulk(self, calories: np.ndarray, goal: Goal) -> np.ndarray:
+        """
+        Batch version of calculate_macros for one goal.
+        Returns an (N, 3) int32 array of [protein_g, carbs_g, fats_g] per row.
+        """
+        divisors = np.array(MACRO_DIV.get(goal, MACRO_DIV[Goal.MAINTENANCE]))
+        return (np.asarray(calories)[:, None] * divisors).astype(np.int32)
\ No newline at end of file
@@ -6,39 +6,118 @@ If the API fails for ANY reason, returns a clean fallback message.
 """
 
 import os
+import re
+import time
+import asyncio
 import logging
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 
 # Configure logger
 logger = logging.getLogger(__name__)
 
 
+# Sentence terminator followed by whitespace or end of text ("1.5" does not count)
+_SENTENCE_END = re.compile(r"[.!?](?=\s|$)")
+
+# Same, mid-stream: the text so far may end inside "0.5", so end of text doesn't count
+_SENTENCE_END_STREAMING = re.compile(r"[.!?](?=\s)")
+
+# Seconds to wait on a stream before settling for the text received so far
+STREAM_TIMEOUT = 10.0
+
+# Most (goal, calories) responses kept per agent; least recently used go first
+INSIGHT_CACHE_SIZE = 512
+
+
+class _EmptyResponse(Exception):
+    """Raised inside the cached call so empty responses are never memoized."""
+
+
+class _PartialResponse(Exception):
+    """Raised when the stream times out; carries the partial text but skips the cache."""
+
+    def __init__(self, text: str):
+        super().__init__("Gemini stream timed out")
+        self.text = text
+
+
 class LLMAgent:
     """
     Agent responsible for generating motivational insights using Google Gemini.
     """
 
     def __init__(self):
+        # Load environment variables on construction, not at module import
+        from dotenv import load_dotenv
+        load_dotenv()
+
         self.api_key = os.getenv("GEMINI_API_KEY")
 
+        # Per-instance memo of real Gemini responses (never fallbacks or partial text)
+        self._insights: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+        self._insights_lock = threading.Lock()
+
         # Safe initialization — NEVER crash app startup
         if not self.api_key:
             logger.error("GEMINI_API_KEY not found. LLM disabled.")
             self.client = None
         else:
             try:
-                self.client = genai.Client(api_key=self.api_key)
+                # Deferred import: google-genai is heavy and only needed with a key
+                from google import genai
+                from google.genai import types
+
+                self._types = types
+                # Transport timeout: a stalled stream never yields a chunk for
+                # _generate's deadline check, so only the socket read can end it
+                self.client = genai.Client(
+                    api_key=self.api_key,
+                    http_options=types.HttpOptions(timeout=int(STREAM_TIMEOUT * 1000))
+                )
                 self.model_name = os.getenv("GEMINI_MODEL", "gemini-flash-latest")
                 logger.info(f"LLMAgent initialized with model: {self.model_name}")
             except Exception as e:
                 logger.error(f"Failed to initialize Gemini client: {e}")
                 self.client = None
 
+    @staticmethod
+    def _resolve_inputs(user_profile: dict, targets: dict) -> Tuple[str, int]:
+        """Extracts the only two prompt inputs: display goal and TARGET calories."""
+        target_cals = targets.get("calories", 2000)
+        goal = user_profile.get("goal", "health").replace("_", " ").title()
+        return goal, target_cals
+
+    @staticmethod
+    def _fallback_text(goal: str, target_cals: int) -> str:
+        """Teacher-Safe fallback (ALWAYS correct)."""
+        return (
+            f"Your {target_cals} kcal plan is carefully designed to support your {goal} goals. "
+            "Maintaining this calorie target helps optimize energy levels, recovery, and "
+            "long-term consistency. Stay committed for the best results."
+        )
+
+    @staticmethod
+    def _build_prompt(goal: str, target_cals: int) -> str:
+        """Constructs the SAFE prompt (NO food totals), kept compact to save prompt tokens."""
+        return (
+            f"You are an expert nutritionist. User goal: {goal}. "
+            f"Target: {target_cals} kcal (use this exact number). "
+            f"In 2 sentences, motivate the user by explaining how this {target_cals} kcal "
+            "plan helps them reach their goal. Do not mention specific foods."
+        )
+
+    @staticmethod
+    def _first_sentences(text: str, count: int = 2, complete: bool = True) -> str:
+        """
+        Returns the first `count` complete sentences of text, or "" if not there yet.
+        Pass complete=False while the text is still streaming in.
+        """
+        pattern = _SENTENCE_END if complete else _SENTENCE_END_STREAMING
+        ends = [m.end() for m in pattern.finditer(text)]
+        return text[:ends[count - 1]] if len(ends) >= count else ""
+
     def explain_plan(self, weekly_plan: dict, user_profile: dict, targets: dict) -> str:
         """
         Generates a short motivational explanation.
@@ -50,44 +129,29 @@ class LLMAgent:
         """
 
         # 1️⃣ Extract target calories (THE truth)
-        target_cals = targets.get("calories", 2000)
-
-        goal = user_profile.get("goal", "health").replace("_", " ").title()
+        goal, target_cals = self._resolve_inputs(user_profile, targets)
 
         # 2️⃣ Teacher-Safe fallback (ALWAYS correct)
-        fallback_text = (
-            f"Your {target_cals} kcal plan is carefully designed to support your {goal} goals. "
-            "Maintaining this calorie target helps optimize energy levels, recovery, and "
-            "long-term consistency. Stay committed for the best results."
-        )
+        fallback_text = self._fallback_text(goal, target_cals)
 
         # 3️⃣ If client is unavailable → silent fallback
         if not self.client:
             logger.warning("LLM client unavailable. Using fallback text.")
             return fallback_text
 
-        try:
-            # 4️⃣ Construct SAFE prompt (NO food totals)
-            prompt = f"""
-            You are an expert Nutritionist.
-
-            USER GOAL: {goal}
-            TARGET CALORIES: {target_cals} kcal (USE THIS EXACT NUMBER)
-
-            TASK:
-            Write a 2-sentence motivational summary explaining how this
-            {target_cals} kcal plan helps the user reach their goal.
-            Avoid mentioning specific foods.
-            """
+        # 4️⃣ Identical (goal, calories) pairs reuse the cached response
+        cached = self._cached_insight(goal, target_cals)
+        if cached is not None:
+            return cached
 
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=prompt,
-                config=types.GenerateContentConfig(temperature=0.7)
-            )
+        try:
+            text = self._generate(goal, target_cals)
+            self._store_insight(goal, target_cals, text)
+            return text
 
-            if response and response.text:
-                return response.text.strip()
+        except _PartialResponse as e:
+            logger.warning("Gemini stream timed out. Using partial text.")
+            return e.text
 
         except Exception as e:
             # 5️⃣ Catch EVERYTHING (quota, network, bad model, etc.)
@@ -95,3 +159,120 @@ class LLMAgent:
 
         # 6️⃣ Absolute safety net
         return fallback_text
+
+    async def explain_plans_batch(
+        self, requests: List[Tuple[dict, dict, dict]], timeout: float = 5.0,
+        max_concurrency: int = 4
+    ) -> List[str]:
+        """
+        Concurrent version of explain_plan for many users.
+
+        Args:
+            requests: (weekly_plan, user_profile, targets) tuples.
+            timeout: Per-request timeout in seconds.
+            max_concurrency: Most API calls in flight at once.
+
+        Returns:
+            One explanation per request, in order. Duplicate (goal, calories)
+            pairs share a single API call, pairs already memoized by explain_plan
+            make none, and new successes are memoized for later calls; failures
+            map to the fallback text.
+        """
+        keys = [self._resolve_inputs(profile, targets) for _, profile, targets in requests]
+
+        if not self.client:
+            logger.warning("LLM client unavailable. Using fallback text.")
+            return [self._fallback_text(*key) for key in keys]
+
+        texts = {}
+        for key in dict.fromkeys(keys):
+            cached = self._cached_insight(*key)
+            if cached is not None:
+                texts[key] = cached
+
+        unique_keys = [key for key in dict.fromkeys(keys) if key not in texts]
+        limit = asyncio.Semaphore(max_concurrency)
+
+        async def bounded(key):
+            # The timeout covers the call itself, not the wait for a free slot
+            async with limit:
+                return await asyncio.wait_for(self._agenerate(*key), timeout)
+
+        results = await asyncio.gather(
+            *(bounded(key) for key in unique_keys),
+            return_exceptions=True
+        )
+
+        for key, result in zip(unique_keys, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Gemini API failure (hidden from UI): {result!r}")
+                texts[key] = self._fallback_text(*key)
+            else:
+                self._store_insight(*key, result)
+                texts[key] = result
+
+        return [texts[key] for key in keys]
+
+    def _cached_insight(self, goal: str, target_cals: int) -> Optional[str]:
+        """Memoized response for the only two prompt inputs, or None."""
+        key = (goal, target_cals)
+        with self._insights_lock:
+            text = self._insights.get(key)
+            if text is not None:
+                self._insights.move_to_end(key)
+            return text
+
+    def _store_insight(self, goal: str, target_cals: int, text: str):
+        """Memoizes a successful response, evicting the least recently used past the cap."""
+        with self._insights_lock:
+            self._insights[(goal, target_cals)] = text
+            self._insights.move_to_end((goal, target_cals))
+            if len(self._insights) > INSIGHT_CACHE_SIZE:
+                self._insights.popitem(last=False)
+
+    def _generate(self, goal: str, target_cals: int) -> str:
+        """
+        Streamed Gemini call for the only two prompt inputs.
+        Failures and timeouts raise instead of returning, so they are never cached.
+        """
+        stream = self.client.models.generate_content_stream(
+            model=self.model_name,
+            contents=self._build_prompt(goal, target_cals),
+            config=self._types.GenerateContentConfig(temperature=0.7)
+        )
+
+        # Stop reading as soon as the two requested sentences have arrived
+        deadline = time.monotonic() + STREAM_TIMEOUT
+        text = ""
+        try:
+            for chunk in stream:
+                text += chunk.text or ""
+                summary = self._first_sentences(text, complete=False)
+                if summary:
+                    return summary.strip()
+                if time.monotonic() > deadline and text.strip():
+                    raise _PartialResponse(text.strip())
+        finally:
+            close = getattr(stream, "close", None)
+            if close:
+                close()
+
+        # Stream exhausted: a terminator at the very end now closes a sentence
+        if text.strip():
+            return (self._first_sentences(text) or text).strip()
+
+        raise _EmptyResponse("Gemini returned an empty response")
+
+    async def _agenerate(self, goal: str, target_cals: int) -> str:
+        """Async Gemini call used by explain_plans_batch."""
+        response = await self.client.aio.models.generate_content(
+            model=self.model_name,
+            contents=self._build_prompt(goal, target_cals),
+            config=self._types.GenerateContentConfig(temperature=0.7)
+        )
+
+        # Same two-sentence shape as _generate: both paths share the _insights memo
+        if response and response.text:
+            return (self._first_sentences(response.text) or response.text).strip()
+
+        raise _EmptyResponse("Gemini returned an empty response")
@@ -1,14 +1,17 @@
+import numpy as np
 import pandas as pd
 import os
 import logging
 import re
 import json
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
+
+from ._kernels import top_k_closest
 
 # --------------------------------------------------
 # LOGGING CONFIGURATION
 # --------------------------------------------------
-logging.basicConfig(level=logging.INFO)
+# Handlers are the application's job (app.py); importing this module must not install one
 logger = logging.getLogger(__name__)
 
 class NutritionAgent:
@@ -16,10 +19,46 @@ class NutritionAgent:
     Nutrition Agent for generating realistic, culturally coherent meal plans.
     """
 
-    def __init__(self, csv_path: str = "expanded_food_dataset_10000.csv"):
+    # Process-wide cleaned frames keyed by absolute CSV path -> (CSV mtime, frame).
+    # Later instances for the same file skip all I/O; treat the shared frame as read-only.
+    _DF_CACHE: Dict[str, Tuple[float, pd.DataFrame]] = {}
+
+    # Daily calorie split per meal
+    MEAL_SPLITS = {
+        "Breakfast": 0.25,
+        "Lunch": 0.40,
+        "Dinner": 0.35
+    }
+
+    # Layout version of the cleaned Parquet copy, part of its filename; bump when _read_csv changes
+    CACHE_VERSION = 2
+
+    def __init__(self, csv_path: str = "expanded_food_dataset_10000.csv", seed: Optional[int] = None):
         self.csv_path = csv_path
+        # Per-instance PCG64 generator: no shared global RNG state, reproducible with a seed
+        self._rng = np.random.default_rng(seed)
+        # Cleaned copy of the dataset; reused while newer than the CSV. The layout
+        # version is part of the filename, so old caches are never read, on any pandas
+        self.cache_path = f"{csv_path}.v{self.CACHE_VERSION}.parquet"
         self.df = None
 
+        # Column arrays extracted once at load time for the selection hot path
+        self._cals = None
+        self._macros = None
+        self._macro_values = None
+        self._names = None
+        self._name_ids = None
+        self._cats = None
+        self._cat_labels = None
+        self._cat_display = None
+        self._compat = None
+        self._diet_masks = {}
+        self._index = {}
+        self._safe_index = {}
+        self._cat_index = {}
+        self._side_pools = {}
+        self._meal_layout = {}
+
         # Comprehensive Non-veg keywords for failsafe checks
         self.non_veg_keywords = [
             "chicken", "fish", "egg", "mutton", "gosht", "biryani",
@@ -27,6 +66,16 @@ class NutritionAgent:
             "lamb", "meat", "bacon", "salami", "duck"
         ]
 
+        # Single alternation: one scan per name instead of a keyword loop.
+        # Letter-only boundaries mirror "split on non-letters" word semantics,
+        # so 'egg' never blocks 'veggie' or 'eggplant'. No lookarounds, so the
+        # pattern stays RE2-compatible and Arrow-backed strings scan it natively.
+        self._nonveg_pattern = (
+            r'(?:^|[^a-z])(?:'
+            + '|'.join(re.escape(k) for k in self.non_veg_keywords)
+            + r')(?:[^a-z]|$)'
+        )
+
         # Realistic food pairing logic
         self.pairing_rules = {
             "curry": ["rice", "flatbread", "dry_veg"],
@@ -48,7 +97,109 @@ class NutritionAgent:
         if not os.path.exists(self.csv_path):
             raise FileNotFoundError(f"Dataset not found: {self.csv_path}")
 
-        df = pd.read_csv(self.csv_path)
+        key = os.path.abspath(self.csv_path)
+        mtime = os.path.getmtime(self.csv_path)
+        cached = NutritionAgent._DF_CACHE.get(key)
+
+        if cached is not None and cached[0] == mtime:
+            df = cached[1]
+        else:
+            df = self._read_cache()
+            if df is None:
+                df = self._read_csv()
+                self._write_cache(df)
+            NutritionAgent._DF_CACHE[key] = (mtime, df)
+
+        self.df = df
+
+        # Pre-extract NumPy views (struct-of-arrays) so meal building never touches pandas
+        self._cals = df["calories"].to_numpy(np.float32)
+        # (N, 3) protein/carbs/fats matrix, plus rounded Python floats per row for output
+        self._macros = df[["protein", "carbs", "fats"]].to_numpy(np.float32)
+        self._macro_values = self._macros.astype(np.float64).round(2).tolist()
+        self._names = df["name"].to_numpy()
+        # One int32 id per distinct name: duplicate-name checks compare ints, not strings
+        self._name_ids = pd.factorize(df["name"])[0].astype(np.int32)
+        # Reuse the stored categorical codebooks instead of re-factorizing strings
+        self._cats = df["category"].cat.codes.to_numpy(np.int8)
+        self._cat_labels = df["category"].cat.categories
+        # Plain list for per-item output; scalar reads from an Arrow-backed Index are slow
+        self._cat_display = [label.title() for label in self._cat_labels]
+
+        # pairing_rules as a (category x category) matrix indexed by code
+        self._compat = np.zeros((len(self._cat_labels), len(self._cat_labels)), dtype=bool)
+        for main_cat, partners in self.pairing_rules.items():
+            if main_cat in self._cat_labels:
+                row = self._cat_labels.get_loc(main_cat)
+                for partner in partners:
+                    if partner in self._cat_labels:
+                        self._compat[row, self._cat_labels.get_loc(partner)] = True
+
+        # Low-cardinality columns compared as integer codes, not strings
+        diets = df["diet"].cat
+        meal_times = df["meal_time"].cat
+        diet_codes = diets.codes.to_numpy()
+        meal_codes = meal_times.codes.to_numpy()
+        self._diet_masks = {
+            diet: diet_codes == code for code, diet in enumerate(diets.categories)
+        }
+
+        # Row positions per (diet, meal_time); (diet, None) is the diet-only fallback
+        self._index = {}
+        for diet, mask in self._diet_masks.items():
+            self._index[(diet, None)] = np.flatnonzero(mask)
+            for code, meal_time in enumerate(meal_times.categories):
+                rows = np.flatnonzero(mask & (meal_codes == code))
+                if rows.size:
+                    self._index[(diet, meal_time)] = rows
+
+        # Ready-to-sample candidates per bucket: Layer 2 is a mask AND on veg buckets
+        veg_safe = df["veg_safe"].to_numpy(bool)
+        self._safe_index = {}
+        for (diet, meal_time), rows in self._index.items():
+            self._safe_index[(diet, meal_time)] = rows[veg_safe[rows]] if diet == "veg" else rows
+
+        # Safe rows per (diet, meal_time, category code) so side lookups touch only partners
+        self._cat_index = {}
+        for (diet, meal_time), safe in self._safe_index.items():
+            safe_cats = self._cats[safe]
+            for code in np.unique(safe_cats):
+                self._cat_index[(diet, meal_time, int(code))] = safe[safe_cats == code]
+
+        # Side candidates per bucket, indexed by the main's category code: only the
+        # final picks are random, so every pool a drawn main can need is joined here
+        self._side_pools = {}
+        for key, safe in self._safe_index.items():
+            pools = [None] * len(self._cat_labels)
+            for main_cat in np.unique(self._cats[safe]):
+                pools[main_cat] = self._join_side_pool(key, main_cat)
+            self._side_pools[key] = pools
+
+        # Per-diet (meal, ratio, bucket key) routing for the whole day, resolved once.
+        # Fallback if specific meal time is empty (though unlikely with 10k rows).
+        self._meal_layout = {}
+        for diet, mask in self._diet_masks.items():
+            if not mask.any():
+                continue
+            layout = []
+            for meal_name, ratio in self.MEAL_SPLITS.items():
+                key = (diet, meal_name.lower())
+                layout.append((meal_name, ratio, key if key in self._safe_index else (diet, None)))
+            self._meal_layout[diet] = layout
+
+        # Trigger the side picker's JIT compile / on-disk cache load now, on the loader
+        # thread, instead of on the first plan request (same argument types as _pick_closest)
+        top_k_closest(self._cals[:1], 0.0, 1)
+
+        logger.info("Nutrition dataset loaded successfully: %d rows", len(self.df))
+
+    def _read_csv(self) -> pd.DataFrame:
+        """Parses and standardizes the raw CSV dataset."""
+        try:
+            # Arrow's multithreaded parser is ~3x faster than the default C engine
+            df = pd.read_csv(self.csv_path, engine="pyarrow")
+        except ImportError:
+            df = pd.read_csv(self.csv_path)
         df.columns = df.columns.str.strip().str.lower()
 
         # Standardize column names to match internal logic
@@ -67,99 +218,98 @@ class NutritionAgent:
         for col in ["name", "diet", "meal_time", "category"]:
             df[col] = df[col].astype(str).str.lower().str.strip()
 
-        self.df = df
-        logger.info(f"Nutrition dataset loaded successfully: {len(self.df)} rows")
+        # Narrow numeric storage: calories fit int16, macros need float32 at most
+        df["calories"] = df["calories"].astype(np.int16)
+        df[["protein", "carbs", "fats"]] = df[["protein", "carbs", "fats"]].astype(np.float32)
 
-    # --------------------------------------------------
-    # DIET SAFETY CHECK (Layer 2: Whole-Word Regex)
-    # --------------------------------------------------
-    def _is_diet_safe(self, food_name: str, diet_pref: str) -> bool:
-        """
-        Uses Regex to ensure keywords match whole words only.
-        This prevents 'egg' from blocking 'veggie' or 'eggplant'.
-        """
-        if diet_pref == "veg":
-            # Remove special characters and split into words
-            clean_name = re.sub(r'[^a-z\s]', ' ', food_name.lower())
-            words = set(clean_name.split())
-            
-            # Check for exact matches against forbidden keywords
-            for keyword in self.non_veg_keywords:
-                if keyword in words:
-                    return False
-        return True
+        # Few distinct values: store as integer-coded categoricals
+        for col in ["diet", "meal_time", "category"]:
+            df[col] = df[col].astype("category")
+
+        # Layer 2 safety materialized once; persisted with the Parquet cache
+        df["veg_safe"] = ~df["name"].str.contains(
+            self._nonveg_pattern, regex=True, case=False, na=False
+        )
+        return df
+
+    def _read_cache(self) -> pd.DataFrame:
+        """Returns the cleaned Parquet copy if it is newer than the CSV, else None."""
+        if not os.path.exists(self.cache_path):
+            return None
+        if os.path.getmtime(self.cache_path) <= os.path.getmtime(self.csv_path):
+            return None
+
+        try:
+            return pd.read_parquet(self.cache_path, engine="pyarrow")
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable dataset cache {self.cache_path}: {e}")
+            return None
+
+    def _write_cache(self, df: pd.DataFrame):
+        """Best-effort write of the cleaned dataset; failures only cost the next startup."""
+        try:
+            df.to_parquet(self.cache_path, engine="pyarrow", index=False)
+        except Exception as e:
+            logger.warning(f"Could not write dataset cache {self.cache_path}: {e}")
 
     # --------------------------------------------------
     # PUBLIC API: RECOMMEND MEAL PLAN
     # --------------------------------------------------
-    def recommend_meal_plan(self, diet_preference: str, total_calories: float) -> Dict[str, Any]:
+    def recommend_meal_plan(self, diet_preference: str, total_calories: float,
+                            seed: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Builds a Breakfast/Lunch/Dinner plan. Pass `seed` for a reproducible plan
+        drawn from its own generator, independent of the instance's stream.
+        """
+        rng = self._rng if seed is None else np.random.default_rng(seed)
         diet_pref = diet_preference.lower().strip()
 
-        # Layer 1: Strict filter based on the CSV 'diet' column
-        diet_df = self.df[self.df["diet"] == diet_pref].copy()
+        # Layer 1: Strict filter based on the CSV 'diet' column (prebuilt layout)
+        layout = self._meal_layout.get(diet_pref)
 
-        if diet_df.empty:
+        if layout is None:
             return {"error": f"No food items found for diet: {diet_preference}"}
 
-        splits = {
-            "Breakfast": 0.25,
-            "Lunch": 0.40,
-            "Dinner": 0.35
+        # Breakfast/Lunch/Dinner buckets were resolved at load; just build the meals
+        return {
+            meal_name: self._build_meal(key, total_calories * ratio, rng)
+            for meal_name, ratio, key in layout
         }
 
-        meal_plan = {}
-        for meal_name, ratio in splits.items():
-            target = total_calories * ratio
-
-            # Filter by meal time (Breakfast/Lunch/Dinner)
-            time_df = diet_df[diet_df["meal_time"] == meal_name.lower()]
-            
-            # Fallback if specific meal time is empty (though unlikely with 10k rows)
-            if time_df.empty:
-                time_df = diet_df 
-
-            meal_plan[meal_name] = self._build_meal(time_df, target, diet_pref)
-
-        return meal_plan
-
     # --------------------------------------------------
     # CORE LOGIC: MEAL BUILDER
     # --------------------------------------------------
-    def _build_meal(self, df: pd.DataFrame, target_calories: float, diet_pref: str) -> Dict[str, Any]:
+    def _build_meal(self, key: Tuple[str, Any], target_calories: float,
+                    rng: np.random.Generator) -> Dict[str, Any]:
+        """
+        Builds a Main + Side meal from the diet-safe bucket at `key`.
+        All scoring runs on NumPy arrays; no DataFrames are allocated per call.
+        """
+        safe_idx = self._safe_index[key]
         selected_items = []
         current_cals = 0
 
         # --- STEP 1: Select Main Item ---
-        # Apply Layer 2 Safety Check before sampling
-        main_candidates = df[
-            df["name"].apply(lambda x: self._is_diet_safe(x, diet_pref))
-        ]
-
-        if main_candidates.empty:
+        # Layer 2 Safety Check was applied to the bucket at load time
+        if safe_idx.size == 0:
             return {"items": [], "total_calories": 0, "warning": "No safe items found"}
 
-        main_item = main_candidates.sample(1).iloc[0]
-        selected_items.append(self._format_item(main_item, "Main"))
-        current_cals += main_item["calories"]
+        main = safe_idx[rng.integers(safe_idx.size)]
+        selected_items.append(self._format_item(main, "Main"))
+        current_cals += self._cals[main]
 
         # --- STEP 2: Select Side Item ---
         remaining = target_calories - current_cals
-        main_cat = main_item["category"]
-        compatible_categories = self.pairing_rules.get(main_cat, [])
 
-        if remaining > 50 and compatible_categories:
-            side_df = df[
-                (df["category"].isin(compatible_categories)) &
-                (df["name"] != main_item["name"]) &
-                (df["name"].apply(lambda x: self._is_diet_safe(x, diet_pref)))
-            ].copy()
+        if remaining > 50:
+            pool_idx, pool_ids = self._side_pools[key][self._cats[main]]
+            side_idx = pool_idx[pool_ids != self._name_ids[main]]
 
-            if not side_df.empty:
+            if side_idx.size:
                 # Find side item closest to remaining calorie target
-                side_df["diff"] = (side_df["calories"] - remaining).abs()
-                side_item = side_df.sort_values("diff").head(5).sample(1).iloc[0]
-                selected_items.append(self._format_item(side_item, "Side"))
-                current_cals += side_item["calories"]
+                side = self._pick_closest(side_idx, remaining, rng)
+                selected_items.append(self._format_item(side, "Side"))
+                current_cals += self._cals[side]
 
         return {
             "items": selected_items,
@@ -167,31 +317,68 @@ class NutritionAgent:
             "macro_summary": self._sum_macros(selected_items)
         }
 
+    def _join_side_pool(self, key: Tuple[str, Any], main_cat: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rows (and name ids) in bucket `key` that pair with a main of category code
+        `main_cat`, joined from the per-category indexes. Built once per pool at
+        load (see _side_pools); the arrays are shared, do not mutate.
+        """
+        parts = [
+            self._cat_index[(*key, int(code))]
+            for code in np.flatnonzero(self._compat[main_cat])
+            if (*key, int(code)) in self._cat_index
+        ]
+        pool = np.concatenate(parts) if parts else np.empty(0, dtype=np.intp)
+        return pool, self._name_ids[pool]
+
+    def _pick_closest(self, idx: np.ndarray, target: float,
+                      rng: np.random.Generator, k: int = 5) -> int:
+        """
+        Picks one of the k rows whose calories are closest to `target`.
+        top_k_closest finds them in a single O(N) pass (JIT-compiled when Numba is available).
+        """
+        top_k = top_k_closest(self._cals[idx], float(target), k)
+        # One scalar draw, then a single scalar index (no gathered top-k array)
+        return idx[top_k[rng.integers(top_k.size)]]
+
     # --------------------------------------------------
     # HELPERS: FORMATTING & CALCULATIONS
     # --------------------------------------------------
-    def _format_item(self, item: pd.Series, role: str) -> Dict[str, Any]:
+    def _format_item(self, row: int, role: str) -> Dict[str, Any]:
+        """
+        Reads one food's scalars straight from the column arrays.
+        Macros come pre-rounded, so float32 storage never leaks digits like 9.300000190734863.
+        """
+        protein, carbs, fats = self._macro_values[row]
         return {
-            "name": item["name"].title(),
+            "name": self._names[row].title(),
             "role": role,
-            "category": item["category"].title(),
-            "calories": int(item["calories"]),
-            "protein": float(item["protein"]),
-            "carbs": float(item["carbs"]),
-            "fats": float(item["fats"])
+            "category": self._cat_display[self._cats[row]],
+            "calories": int(self._cals[row]),
+            "protein": protein,
+            "carbs": carbs,
+            "fats": fats
         }
 
     def _sum_macros(self, items: List[Dict[str, Any]]) -> Dict[str, float]:
+        # One pass over the (usually 1-2) items; beats a NumPy gather + sum at this size
+        protein = carbs = fats = 0.0
+        for item in items:
+            protein += item["protein"]
+            carbs += item["carbs"]
+            fats += item["fats"]
         return {
-            "protein": round(sum(i["protein"] for i in items), 2),
-            "carbs": round(sum(i["carbs"] for i in items), 2),
-            "fats": round(sum(i["fats"] for i in items), 2)
+            "protein": round(protein, 2),
+            "carbs": round(carbs, 2),
+            "fats": round(fats, 2)
         }
 
 # --------------------------------------------------
 # EXECUTION BLOCK (Test Run)
 # --------------------------------------------------
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
     # Initialize the agent
     agent = NutritionAgent("expanded_food_dataset_10000.csv")
     
@@ -6,10 +6,15 @@ calls the RecommendationEngine, and displays the 7-day plan
 in a modern, interactive dashboard format.
 """
 
+import os
 import streamlit as st
 import logging
+import re
+import json
+import hashlib
+from concurrent.futures import Future, ThreadPoolExecutor
 import plotly.graph_objects as go
-from services.recommendation_engine import RecommendationEngine
+from services.recommendation_engine import DAY_LABELS, get_recommendation_engine
 
 # -------------------------------------------------
 # 1. PAGE CONFIGURATION (Must be first)
@@ -21,15 +26,21 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Configure Logging
-logging.basicConfig(level=logging.INFO)
+# Configure Logging (set MACROMIND_LOG=INFO or DEBUG for verbose runs)
+logging.basicConfig(
+    level=getattr(logging, os.environ.get("MACROMIND_LOG", "WARNING").upper(), logging.WARNING)
+)
 logger = logging.getLogger(__name__)
 
 # -------------------------------------------------
 # 2. CUSTOM CSS - PREMIUM DARK MODE THEME
 # -------------------------------------------------
-def inject_custom_css():
-    st.markdown("""
+def _minify_css(css):
+    """Strips comments and collapses whitespace so every rerun ships a smaller style block."""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    return re.sub(r"\s+", " ", css).strip()
+
+_CUSTOM_CSS = _minify_css("""
     <style>
     /* Import Modern Font */
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700;800&display=swap');
@@ -71,12 +82,8 @@ def inject_custom_css():
         width: 200%;
         height: 200%;
         background: radial-gradient(circle, rgba(102, 126, 234, 0.1) 0%, transparent 70%);
-        animation: pulse 4s ease-in-out infinite;
-    }
-    
-    @keyframes pulse {
-        0%, 100% { transform: scale(1); opacity: 0.5; }
-        50% { transform: scale(1.1); opacity: 0.8; }
+        /* Static glow (no infinite animation repainting this oversized layer) */
+        opacity: 0.65;
     }
     
     .hero-logo {
@@ -169,7 +176,7 @@ def inject_custom_css():
         font-weight: 600;
         font-size: 1.1rem;
         letter-spacing: 0.5px;
-        transition: all 0.3s ease;
+        transition: transform 0.3s ease, box-shadow 0.3s ease;
         box-shadow: 0 4px 15px rgba(102, 126, 234, 0.4);
     }
     
@@ -180,16 +187,28 @@ def inject_custom_css():
     
     /* Dashboard Metric Cards */
     .dashboard-card {
-        background: linear-gradient(135deg, rgba(102, 126, 234, 0.1) 0%, rgba(118, 75, 162, 0.1) 100%);
-        backdrop-filter: blur(10px);
+        background: linear-gradient(135deg, rgba(102, 126, 234, 0.15) 0%, rgba(118, 75, 162, 0.15) 100%);
         border-radius: 16px;
         border: 1px solid rgba(102, 126, 234, 0.3);
         padding: 1.5rem;
         text-align: center;
-        transition: all 0.3s ease;
+        transition: transform 0.3s ease, box-shadow 0.3s ease, border-color 0.3s ease;
         height: 100%;
     }
     
+    /* The four metric cards share one element */
+    .dashboard-row {
+        display: grid;
+        grid-template-columns: repeat(4, 1fr);
+        gap: 1rem;
+    }
+    
+    @media (max-width: 640px) {
+        .dashboard-row {
+            grid-template-columns: repeat(2, 1fr);
+        }
+    }
+    
     .dashboard-card:hover {
         transform: translateY(-5px);
         box-shadow: 0 8px 24px rgba(102, 126, 234, 0.4);
@@ -234,8 +253,7 @@ def inject_custom_css():
     
     /* Glassmorphism Container */
     .glass-container {
-        background: rgba(255, 255, 255, 0.03);
-        backdrop-filter: blur(10px);
+        background: rgba(255, 255, 255, 0.06);
         border-radius: 16px;
         border: 1px solid rgba(255, 255, 255, 0.1);
         padding: 1.5rem;
@@ -245,13 +263,12 @@ def inject_custom_css():
     
     /* Meal Card Styling - UPGRADED */
     .meal-card {
-        background: linear-gradient(135deg, rgba(102, 126, 234, 0.12) 0%, rgba(118, 75, 162, 0.12) 100%);
-        backdrop-filter: blur(10px);
+        background: linear-gradient(135deg, rgba(102, 126, 234, 0.15) 0%, rgba(118, 75, 162, 0.15) 100%);
         border-radius: 14px;
         border: 1px solid rgba(102, 126, 234, 0.25);
         padding: 1.3rem;
         margin: 0.5rem 0;
-        transition: all 0.3s ease;
+        transition: transform 0.3s ease, box-shadow 0.3s ease, border-color 0.3s ease;
         min-height: 180px;
         display: flex;
         flex-direction: column;
@@ -298,6 +315,19 @@ def inject_custom_css():
         text-align: center;
     }
     
+    /* One row of meal cards per day (stacks like st.columns on narrow screens) */
+    .meal-row, .feature-row {
+        display: grid;
+        grid-template-columns: repeat(3, 1fr);
+        gap: 1rem;
+    }
+    
+    @media (max-width: 640px) {
+        .meal-row, .feature-row {
+            grid-template-columns: 1fr;
+        }
+    }
+    
     .macro-label {
         font-size: 0.75rem;
         color: #999;
@@ -327,7 +357,7 @@ def inject_custom_css():
         font-size: 1rem;
         padding: 0.7rem 1.5rem;
         border: 1px solid rgba(102, 126, 234, 0.2);
-        transition: all 0.2s ease;
+        transition: background 0.2s ease, border-color 0.2s ease;
     }
     
     .stTabs [data-baseweb="tab"]:hover {
@@ -381,6 +411,30 @@ def inject_custom_css():
         margin: 1rem 0;
     }
     
+    /* Macro Donut */
+    .donut-chart svg {
+        display: block;
+        width: 100%;
+        max-width: 280px;
+        margin: 1rem auto;
+    }
+    
+    .donut-legend {
+        display: flex;
+        justify-content: center;
+        gap: 1rem;
+        color: white;
+        font-size: 0.9rem;
+    }
+    
+    .donut-key i {
+        display: inline-block;
+        width: 10px;
+        height: 10px;
+        border-radius: 50%;
+        margin-right: 0.4rem;
+    }
+    
     /* Feature Card */
     .feature-card {
         background: rgba(255, 255, 255, 0.03);
@@ -401,95 +455,119 @@ def inject_custom_css():
         margin: 0.5rem 0 0 0;
     }
     </style>
-    """, unsafe_allow_html=True)
+    """)
+
+def inject_custom_css():
+    # Streamlit drops elements a rerun does not emit, so the (prebuilt) block is sent every run
+    st.markdown(_CUSTOM_CSS, unsafe_allow_html=True)
 
 # -------------------------------------------------
 # 3. INITIALIZATION & CACHING
 # -------------------------------------------------
 @st.cache_resource
-def load_engine():
+def load_engine() -> Future:
     """
-    Load the engine once and cache it. 
-    This prevents reloading the 10,000-row dataset on every click.
+    Start loading the engine once, in a background thread, and cache the future.
+    The 10,000-row dataset loads while the page paints and the user fills in the form.
     """
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="engine-loader")
+    future = executor.submit(get_recommendation_engine)
+    executor.shutdown(wait=False)
+    return future
+
+def get_engine():
+    """Blocks until the engine is ready; None if it failed to load."""
     try:
-        return RecommendationEngine()
+        return load_engine().result()
     except Exception as e:
         st.error(f"Failed to load application engine: {e}")
         return None
 
-engine = load_engine()
+load_engine()
+
+class PlanError(Exception):
+    """Raised for error results so st.cache_data never stores them."""
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def generate_meal_plan_cached(_engine, user_profile, _pending):
+    """
+    Memoized engine.generate_plan without the AI insight, shared across sessions for an hour.
+    The cache key is the profile dict; leading underscores keep the engine and `_pending` out of it.
+    On a miss the already-running insight call is handed back through `_pending`.
+    """
+    result = _engine.generate_plan(user_profile, defer_insight=True)
+    if "error" in result:
+        raise PlanError(result["error"])
+    _pending["insight"] = result.pop("ai_insight_future")
+    return result
+
+def generate_plan_cached(engine, user_profile):
+    """
+    Cached meal plan plus a fresh AI insight. The insight stays out of st.cache_data
+    so a fallback is never served for an hour; LLMAgent memoizes real responses itself.
+    """
+    pending = {}
+    result = generate_meal_plan_cached(engine, user_profile, pending)
+    result["ai_insight"] = engine.resolve_insight(result, pending.get("insight"))
+    return result
 
 # -------------------------------------------------
 # 4. UI HELPER FUNCTIONS
 # -------------------------------------------------
 def render_hero_section():
     """Renders the hero section with branding."""
-    st.markdown("""
+    st.html("""
     <div class="hero-section">
         <div class="hero-logo">🧠</div>
         <div class="hero-title">MacroMind AI</div>
     </div>
-    """, unsafe_allow_html=True)
+    """)
 
 def render_dashboard_metrics(targets, bio):
-    """Renders key metrics in a dashboard-style layout."""
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        st.markdown(f"""
-        <div class="dashboard-card">
-            <div class="dashboard-label">Daily Target</div>
-            <div class="dashboard-value">{targets['calories']}</div>
-            <div class="dashboard-sublabel">kcal/day</div>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col2:
-        st.markdown(f"""
-        <div class="dashboard-card">
-            <div class="dashboard-label">BMI Score</div>
-            <div class="dashboard-value">{bio['bmi']}</div>
-            <div class="dashboard-sublabel">{bio['bmi_category']}</div>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col3:
-        st.markdown(f"""
-        <div class="dashboard-card">
-            <div class="dashboard-label">Protein Goal</div>
-            <div class="dashboard-value">{targets['protein']}</div>
-            <div class="dashboard-sublabel">grams/day</div>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col4:
-        st.markdown(f"""
+    """Renders key metrics in a dashboard-style layout (one element, 4-column CSS grid)."""
+    cards = (
+        ("Daily Target", targets['calories'], "kcal/day"),
+        ("BMI Score", bio['bmi'], bio['bmi_category']),
+        ("Protein Goal", targets['protein'], "grams/day"),
+        ("Hydration", "3.5", "liters/day"),
+    )
+    cards_html = "".join(f"""
         <div class="dashboard-card">
-            <div class="dashboard-label">Hydration</div>
-            <div class="dashboard-value">3.5</div>
-            <div class="dashboard-sublabel">liters/day</div>
+            <div class="dashboard-label">{label}</div>
+            <div class="dashboard-value">{value}</div>
+            <div class="dashboard-sublabel">{sublabel}</div>
         </div>
-        """, unsafe_allow_html=True)
+        """ for label, value, sublabel in cards)
+    st.html(f'<div class="dashboard-row">{cards_html}</div>')
 
-def render_meal_card_upgraded(meal_type, meal_data, emoji):
-    """Renders meal cards with combined food items format."""
+def build_meal_card_html(meal_type, meal_data, emoji):
+    """Builds one meal card (combined food items format) as an HTML string."""
     
     # Combine food items with "+"
     if "items" in meal_data and meal_data["items"]:
         food_names = [item['name'] for item in meal_data["items"]]
         combined_text = " + ".join(food_names)
         
-        # Calculate totals
-        total_protein = sum(item['protein'] for item in meal_data["items"])
-        total_carbs = sum(item['carbs'] for item in meal_data["items"])
-        total_fats = sum(item['fats'] for item in meal_data["items"])
         total_cals = meal_data.get('total_calories', 0)
+
+        # Macro strings were formatted once by the engine; older plans fall back here
+        display = meal_data.get("display")
+        if display is None:
+            totals = meal_data.get("macro_summary")
+            if totals is None:
+                # Single pass over the items instead of one generator per macro
+                totals = {"protein": 0, "carbs": 0, "fats": 0}
+                for item in meal_data["items"]:
+                    totals["protein"] += item['protein']
+                    totals["carbs"] += item['carbs']
+                    totals["fats"] += item['fats']
+            display = {key: f"{int(value)}g" for key, value in totals.items()}
     else:
         combined_text = "No specific recommendation"
-        total_protein = total_carbs = total_fats = total_cals = 0
+        total_cals = 0
+        display = {"protein": "0g", "carbs": "0g", "fats": "0g"}
     
-    st.markdown(f"""
+    return f"""
     <div class="meal-card">
         <div class="meal-title">{emoji} {meal_type}</div>
         <div class="meal-combined">{combined_text}</div>
@@ -500,52 +578,52 @@ def render_meal_card_upgraded(meal_type, meal_data, emoji):
             </div>
             <div class="macro-stat">
                 <div class="macro-label">Protein</div>
-                <div class="macro-value">{int(total_protein)}g</div>
+                <div class="macro-value">{display['protein']}</div>
             </div>
             <div class="macro-stat">
                 <div class="macro-label">Carbs</div>
-                <div class="macro-value">{int(total_carbs)}g</div>
+                <div class="macro-value">{display['carbs']}</div>
             </div>
             <div class="macro-stat">
                 <div class="macro-label">Fats</div>
-                <div class="macro-value">{int(total_fats)}g</div>
+                <div class="macro-value">{display['fats']}</div>
             </div>
         </div>
     </div>
-    """, unsafe_allow_html=True)
-
-def create_macro_donut_chart(macros):
-    """Creates a Plotly donut chart for macronutrient distribution."""
-    labels = ['Protein', 'Carbs', 'Fats']
-    values = [macros['protein'], macros['carbs'], macros['fats']]
-    colors = ['#667eea', '#764ba2', '#f093fb']
-    
-    fig = go.Figure(data=[go.Pie(
-        labels=labels,
-        values=values,
-        hole=0.6,
-        marker=dict(colors=colors, line=dict(color='#1a1a2e', width=2)),
-        textinfo='label+percent',
-        textfont=dict(size=14, color='white'),
-        hovertemplate='<b>%{label}</b><br>%{value}g<br>%{percent}<extra></extra>'
-    )])
-    
-    fig.update_layout(
-        showlegend=False,
-        paper_bgcolor='rgba(0,0,0,0)',
-        plot_bgcolor='rgba(0,0,0,0)',
-        margin=dict(t=40, b=40, l=20, r=20),
-        height=350,
-        font=dict(family='Inter', color='white'),
-        annotations=[dict(
-            text=f'<b>{int(sum(values))}g</b><br>Total',
-            x=0.5, y=0.5,
-            font=dict(size=20, color='white'),
-            showarrow=False
-        )]
+    """
+
+def build_macro_donut_html(protein, carbs, fats):
+    """
+    Builds the macronutrient donut as inline SVG.
+    Each slice is a stroked arc on a circle of circumference 100, so its dash is its percentage.
+    """
+    slices = (("Protein", protein, '#667eea'), ("Carbs", carbs, '#764ba2'), ("Fats", fats, '#f093fb'))
+    total = protein + carbs + fats
+    
+    arcs, legend = [], []
+    offset = 25  # Start the first slice at 12 o'clock
+    for label, value, color in slices:
+        pct = value / total * 100 if total > 0 else 0
+        arcs.append(
+            f'<circle cx="21" cy="21" r="15.9155" fill="none" stroke="{color}" stroke-width="6" '
+            f'stroke-dasharray="{pct:.2f} {100 - pct:.2f}" stroke-dashoffset="{offset:.2f}">'
+            f'<title>{label}: {int(value)}g ({pct:.0f}%)</title></circle>'
+        )
+        legend.append(f'<span class="donut-key"><i style="background:{color}"></i>{label} {pct:.0f}%</span>')
+        offset -= pct
+    
+    # No indentation: st.markdown would read 4-space-indented lines as a code block
+    return (
+        '<div class="donut-chart">'
+        '<svg viewBox="0 0 42 42" role="img" aria-label="Macronutrient distribution">'
+        '<circle cx="21" cy="21" r="15.9155" fill="none" stroke="rgba(102, 126, 234, 0.1)" stroke-width="6"/>'
+        f'{"".join(arcs)}'
+        f'<text x="21" y="21" text-anchor="middle" fill="white" font-size="5" font-weight="700">{int(total)}g</text>'
+        '<text x="21" y="26" text-anchor="middle" fill="#b0b0b0" font-size="3">Total</text>'
+        '</svg>'
+        f'<div class="donut-legend">{"".join(legend)}</div>'
+        '</div>'
     )
-    
-    return fig
 
 def create_progress_chart():
     """Creates a mock projected weight progress line chart."""
@@ -588,6 +666,116 @@ def create_progress_chart():
     
     return fig
 
+# Mock data never changes: build the progress figure once per process.
+# Kept as a Figure: st.plotly_chart re-validates plain dicts by rebuilding a Figure each run.
+PROGRESS_FIG = create_progress_chart()
+
+# Fixed layout of the weekly plan view (day keys come from the engine's DAY_LABELS)
+MEAL_SPECS = (("Breakfast", "🍳"), ("Lunch", "🍛"), ("Dinner", "🍲"))
+MACRO_TARGETS = (("protein", "Protein"), ("carbs", "Carbs"), ("fats", "Fats"))
+
+# Static landing-page feature cards, assembled once into a single element
+_FEATURES = (
+    ("🧮 Health Agent", "Calculates your exact metabolic needs using advanced algorithms and scientific formulas."),
+    ("🍽️ Nutrition Agent", "Scans 10,000+ foods to find the best combinations tailored to your preferences."),
+    ("🤖 Cognitive Agent", "Reviews the plan to ensure it's balanced and explains the reasoning behind each choice."),
+)
+_LANDING_HTML = '<div class="feature-row">' + "".join(
+    f'<div class="feature-card"><h4>{title}</h4><p>{desc}</p></div>' for title, desc in _FEATURES
+) + '</div>'
+
+def profile_key(user_profile):
+    """Short, stable hash of the profile inputs; identifies the plan they produced."""
+    payload = json.dumps(user_profile, sort_keys=True).encode()
+    return hashlib.blake2b(payload, digest_size=8).hexdigest()
+
+@st.fragment
+def render_results(result):
+    """
+    Renders the insight box, dashboard and tabs for a generated plan.
+    Runs as a fragment, so interactions inside it rerun only this block.
+    """
+    # 1. AI Insight Box
+    st.html(f"""
+    <div class="glass-container" style="background: linear-gradient(135deg, rgba(102, 234, 180, 0.1) 0%, rgba(102, 126, 234, 0.1) 100%); border-color: rgba(102, 234, 180, 0.3);">
+        <div style="font-size: 1.1rem; color: #e0e0e0;">
+            <strong style="color: #66eab4;">💡 AI Coach Insight:</strong><br/>
+            {result['ai_insight']}
+        </div>
+    </div>
+    """)
+
+    st.html("<br/>")
+
+    # 2. Dashboard Metrics
+    targets = result["nutritional_targets"]
+    bio = result["biometrics"]
+    render_dashboard_metrics(targets, bio)
+
+    st.html("<br/><br/>")
+
+    # 3. Main Content Tabs
+    tab_plan, tab_analytics = st.tabs(["📅 Weekly Meal Plan", "📊 Analytics & Insights"])
+
+    with tab_plan:
+        weekly_plan = result["weekly_plan"]
+
+        # Create sub-tabs for each day
+        day_tabs = st.tabs(DAY_LABELS)
+
+        for idx, (day_name, day_data) in enumerate(weekly_plan.items()):
+            with day_tabs[idx]:
+                # Layout: one element per day, meals in a 3-column CSS grid
+                meals = day_data["meals"]
+                cards = "".join(
+                    build_meal_card_html(meal_type, meals[meal_type], emoji)
+                    for meal_type, emoji in MEAL_SPECS
+                )
+                st.html(
+                    f"<h3>Total: {day_data['calories']} kcal</h3><br/>"
+                    f'<div class="meal-row">{cards}</div>'
+                )
+
+    with tab_analytics:
+        st.html("<h2>Nutrition Analytics</h2>")
+        st.html("<br/>")
+
+        # Two columns for charts
+        col_left, col_right = st.columns(2)
+
+        with col_left:
+            st.html('<div class="chart-container">')
+            st.html("<h3>Macronutrient Distribution</h3>")
+            day1_macros = result["weekly_plan"]["Day 1"]["macros"]
+            # st.html sanitizes with DOMPurify's HTML profile, which strips <svg>
+            st.markdown(build_macro_donut_html(
+                day1_macros['protein'], day1_macros['carbs'], day1_macros['fats']
+            ), unsafe_allow_html=True)
+            st.html('</div>')
+
+        with col_right:
+            st.html('<div class="chart-container">')
+            st.html("<h3>Projected Progress</h3>")
+            st.plotly_chart(PROGRESS_FIG, use_container_width=True)
+            st.html('</div>')
+
+        st.html("<br/>")
+
+        # Detailed Macro Breakdown
+        st.html('<div class="glass-container">')
+        st.html("<h3>Daily Macro Targets</h3>")
+
+        # Clamped fill ratio per macro; max() guards a zero target instead of offsetting every target by 0.1
+        for col, (key, label) in zip(st.columns(3), MACRO_TARGETS):
+            with col:
+                st.metric(f"{label} Target", f"{targets[key]}g")
+                ratio = min(1.0, day1_macros[key] / max(targets[key], 1e-6))
+                st.progress(ratio, text=f"Current: {day1_macros[key]}g")
+
+        st.html('</div>')
+
+        st.info("💡 This plan is optimized to help you reach your goals while maintaining energy and health.")
+
 # -------------------------------------------------
 # 5. MAIN APPLICATION LOGIC
 # -------------------------------------------------
@@ -599,8 +787,9 @@ def main():
     render_hero_section()
 
     # --- SIDEBAR (INPUTS) ---
-    with st.sidebar:
-        st.markdown("<h2>👤 Your Profile</h2>", unsafe_allow_html=True)
+    # A form batches the widget edits: only the submit button triggers a rerun
+    with st.sidebar.form("profile", clear_on_submit=False):
+        st.html("<h2>👤 Your Profile</h2>")
         
         # Biometrics
         age = st.number_input("Age", 18, 90, 25)
@@ -609,7 +798,7 @@ def main():
         weight = st.number_input("Weight (kg)", 40, 180, 70)
         
         st.divider()
-        st.markdown("<h2>🎯 Goals & Lifestyle</h2>", unsafe_allow_html=True)
+        st.html("<h2>🎯 Goals & Lifestyle</h2>")
         
         activity_level = st.select_slider(
             "Activity Level",
@@ -630,163 +819,56 @@ def main():
         )
         
         st.divider()
-        generate_btn = st.button("✨ Generate My Plan", type="primary", use_container_width=True)
+        generate_btn = st.form_submit_button("✨ Generate My Plan", type="primary", use_container_width=True)
 
     # --- MAIN CONTENT ---
     if generate_btn:
-        if not engine:
-            st.error("Engine not loaded. Please check logs.")
-            return
-
-        with st.spinner("🔄 AI Agents are collaborating... Analyzing Metabolism..."):
-            # Prepare Input
-            user_profile = {
-                "age": age,
-                "gender": gender,
-                "height": height,
-                "weight": weight,
-                "activity_level": activity_level,
-                "goal": goal,
-                "diet_preference": diet_pref,
-                "name": "User"
-            }
-            
-            # CALL ENGINE
-            result = engine.generate_plan(user_profile)
-        
-        if "error" in result:
-            st.error(result["error"])
-        else:
-            # --- DISPLAY RESULTS ---
-            
-            # 1. AI Insight Box
-            st.markdown(f"""
-            <div class="glass-container" style="background: linear-gradient(135deg, rgba(102, 234, 180, 0.1) 0%, rgba(102, 126, 234, 0.1) 100%); border-color: rgba(102, 234, 180, 0.3);">
-                <div style="font-size: 1.1rem; color: #e0e0e0;">
-                    <strong style="color: #66eab4;">💡 AI Coach Insight:</strong><br/>
-                    {result['ai_insight']}
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            st.markdown("<br/>", unsafe_allow_html=True)
-            
-            # 2. Dashboard Metrics
-            targets = result["nutritional_targets"]
-            bio = result["biometrics"]
-            render_dashboard_metrics(targets, bio)
-            
-            st.markdown("<br/><br/>", unsafe_allow_html=True)
-            
-            # 3. Main Content Tabs
-            tab_plan, tab_analytics = st.tabs(["📅 Weekly Meal Plan", "📊 Analytics & Insights"])
-            
-            with tab_plan:
-                weekly_plan = result["weekly_plan"]
-                
-                # Create sub-tabs for each day
-                day_tabs = st.tabs([f"Day {i+1}" for i in range(7)])
-                
-                for idx, (day_name, day_data) in enumerate(weekly_plan.items()):
-                    with day_tabs[idx]:
-                        st.markdown(f"<h3>Total: {day_data['calories']} kcal</h3>", unsafe_allow_html=True)
-                        st.markdown("<br/>", unsafe_allow_html=True)
-                        
-                        # Layout: 3 Columns for meals
-                        c1, c2, c3 = st.columns(3)
-                        
-                        with c1:
-                            render_meal_card_upgraded("Breakfast", day_data["meals"]["Breakfast"], "🍳")
-                        with c2:
-                            render_meal_card_upgraded("Lunch", day_data["meals"]["Lunch"], "🍛")
-                        with c3:
-                            render_meal_card_upgraded("Dinner", day_data["meals"]["Dinner"], "🍲")
-            
-            with tab_analytics:
-                st.markdown("<h2>Nutrition Analytics</h2>", unsafe_allow_html=True)
-                st.markdown("<br/>", unsafe_allow_html=True)
-                
-                # Two columns for charts
-                col_left, col_right = st.columns(2)
-                
-                with col_left:
-                    st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-                    st.markdown("<h3>Macronutrient Distribution</h3>", unsafe_allow_html=True)
-                    day1_macros = result["weekly_plan"]["Day 1"]["macros"]
-                    fig_donut = create_macro_donut_chart(day1_macros)
-                    st.plotly_chart(fig_donut, use_container_width=True)
-                    st.markdown('</div>', unsafe_allow_html=True)
-                
-                with col_right:
-                    st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-                    st.markdown("<h3>Projected Progress</h3>", unsafe_allow_html=True)
-                    fig_progress = create_progress_chart()
-                    st.plotly_chart(fig_progress, use_container_width=True)
-                    st.markdown('</div>', unsafe_allow_html=True)
-                
-                st.markdown("<br/>", unsafe_allow_html=True)
-                
-                # Detailed Macro Breakdown
-                st.markdown('<div class="glass-container">', unsafe_allow_html=True)
-                st.markdown("<h3>Daily Macro Targets</h3>", unsafe_allow_html=True)
-                
-                c1, c2, c3 = st.columns(3)
-                
-                with c1:
-                    st.metric("Protein Target", f"{targets['protein']}g")
-                    p_val = min(day1_macros['protein'] / (targets['protein'] + 0.1), 1.0)
-                    st.progress(p_val, text=f"Current: {day1_macros['protein']}g")
-                    
-                with c2:
-                    st.metric("Carbs Target", f"{targets['carbs']}g")
-                    c_val = min(day1_macros['carbs'] / (targets['carbs'] + 0.1), 1.0)
-                    st.progress(c_val, text=f"Current: {day1_macros['carbs']}g")
-                    
-                with c3:
-                    st.metric("Fats Target", f"{targets['fats']}g")
-                    f_val = min(day1_macros['fats'] / (targets['fats'] + 0.1), 1.0)
-                    st.progress(f_val, text=f"Current: {day1_macros['fats']}g")
-                
-                st.markdown('</div>', unsafe_allow_html=True)
-                
-                st.info("💡 This plan is optimized to help you reach your goals while maintaining energy and health.")
+        # Prepare Input
+        user_profile = {
+            "age": age,
+            "gender": gender,
+            "height": height,
+            "weight": weight,
+            "activity_level": activity_level,
+            "goal": goal,
+            "diet_preference": diet_pref,
+            "name": "User"
+        }
+
+        # Only run the agents when the inputs changed since the last plan
+        plan_key = profile_key(user_profile)
+        if st.session_state.get("plan_key") != plan_key:
+            engine = get_engine()
+            if not engine:
+                st.error("Engine not loaded. Please check logs.")
+                return
 
+            try:
+                with st.spinner("🔄 AI Agents are collaborating... Analyzing Metabolism..."):
+                    # CALL ENGINE (cached on the exact profile)
+                    result = generate_plan_cached(engine, user_profile)
+            except PlanError as e:
+                st.error(str(e))
+                return
+
+            st.session_state["last_plan"] = result
+            st.session_state["plan_key"] = plan_key
+
+    result = st.session_state.get("last_plan")
+    if result is not None:
+        # --- DISPLAY RESULTS ---
+        render_results(result)
     else:
         # Landing Page Content
-        st.markdown('<div class="glass-container">', unsafe_allow_html=True)
+        st.html('<div class="glass-container">')
         st.info("👈 Enter your details in the sidebar and click 'Generate My Plan' to start!")
-        st.markdown('</div>', unsafe_allow_html=True)
+        st.html('</div>')
         
-        st.markdown("<br/>", unsafe_allow_html=True)
+        st.html("<br/>")
         
         # Feature Cards
-        st.markdown("<h2>How It Works</h2>", unsafe_allow_html=True)
-        
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            st.markdown("""
-            <div class="feature-card">
-                <h4>🧮 Health Agent</h4>
-                <p>Calculates your exact metabolic needs using advanced algorithms and scientific formulas.</p>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col2:
-            st.markdown("""
-            <div class="feature-card">
-                <h4>🍽️ Nutrition Agent</h4>
-                <p>Scans 10,000+ foods to find the best combinations tailored to your preferences.</p>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col3:
-            st.markdown("""
-            <div class="feature-card">
-                <h4>🤖 Cognitive Agent</h4>
-                <p>Reviews the plan to ensure it's balanced and explains the reasoning behind each choice.</p>
-            </div>
-            """, unsafe_allow_html=True)
+        st.html("<h2>How It Works</h2>")
+        st.html(_LANDING_HTML)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -7,16 +7,93 @@ This is the main orchestration layer that connects:
 3. LLM Agent (AI Explanation)
 """
 
+import asyncio
 import logging
-from typing import Dict, Any
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, Any, List, Optional, Tuple, TypedDict
 
 # Import your agents
 from agents import HealthAgent, NutritionAgent, LLMAgent
+from agents.llm_agent import STREAM_TIMEOUT
 
 # Configure logger
 logger = logging.getLogger(__name__)
 
 
+def _env_workers(name: str, default: int) -> int:
+    """Positive worker count from the environment; missing or bad values use the default."""
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except ValueError:
+        logger.warning(f"Invalid {name}={os.environ[name]!r}. Using default: {default}")
+        return default
+
+
+# Gemini calls are network-bound; they run here while the meal plan is built.
+# One process-wide pool, so its size also caps concurrent calls to the LLM backend.
+LLM_WORKERS = _env_workers("MACROMIND_LLM_WORKERS", 4)
+_LLM_POOL = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm-insight")
+
+# Batch LLM calls run on one long-lived event loop: the Gemini async client
+# binds its transport to the loop it first runs on, so a fresh asyncio.run per
+# batch would leave it pointing at a closed loop
+_LLM_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LLM_LOOP_LOCK = threading.Lock()
+
+
+def _llm_loop() -> asyncio.AbstractEventLoop:
+    """Returns the shared batch event loop, starting its thread on first use."""
+    global _LLM_LOOP
+    if _LLM_LOOP is None:
+        with _LLM_LOOP_LOCK:
+            if _LLM_LOOP is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-batch-loop", daemon=True).start()
+                _LLM_LOOP = loop
+    return _LLM_LOOP
+
+# Longest generate_plan waits on the insight. LLMAgent's transport timeout
+# releases a stalled stream's worker; this bounds the request on top of that
+INSIGHT_TIMEOUT = STREAM_TIMEOUT + 5.0
+
+# User-facing errors shared by generate_plan and generate_plans
+HEALTH_ERROR = "Could not analyze health metrics. Check input data."
+UNEXPECTED_ERROR = "An unexpected error occurred while generating your plan."
+
+# Shown in place of the AI explanation when the LLM step itself fails
+INSIGHT_UNAVAILABLE = "AI insight is unavailable right now."
+
+# Keys of the weekly plan, in display order
+DAY_LABELS = tuple(f"Day {day}" for day in range(1, 8))
+
+# Shared read-only default for meals without a macro summary
+_EMPTY_MACROS: Dict[str, float] = {}
+
+
+class DayPlan(TypedDict):
+    """One day of the weekly plan."""
+    meals: Dict[str, Dict[str, Any]]
+    calories: int
+    macros: Dict[str, float]
+
+
+class FinalPlan(TypedDict, total=False):
+    """
+    Shape of a generate_plan result. These stay plain dicts at runtime, so the
+    UI, pickling and st.cache_data handle them unchanged.
+    Error results carry only "error".
+    """
+    user_profile: Dict[str, Any]
+    biometrics: Dict[str, Any]
+    nutritional_targets: Dict[str, Any]
+    weekly_plan: Dict[str, DayPlan]
+    ai_insight: str
+    ai_insight_future: Future
+    error: str
+
+
 class RecommendationEngine:
     """
     Orchestrator for generating personalized diet plans.
@@ -42,12 +119,16 @@ class RecommendationEngine:
             logger.error(f"Failed to initialize RecommendationEngine: {e}")
             raise
 
-    def generate_plan(self, user_profile: Dict[str, Any]) -> Dict[str, Any]:
+    def generate_plan(self, user_profile: Dict[str, Any],
+                      defer_insight: bool = False) -> FinalPlan:
         """
         Generates a complete 7-day diet plan based on user profile.
 
         Args:
             user_profile (dict): User data (age, weight, height, goal, etc.)
+            defer_insight (bool): Return as soon as the meals are ready. The plan
+                then carries "ai_insight_future" (a concurrent.futures.Future
+                resolving to the text) instead of "ai_insight".
 
         Returns:
             dict: The final plan including biometrics, meals, and AI explanation.
@@ -55,86 +136,259 @@ class RecommendationEngine:
         logger.info(f"Generating plan for user: {user_profile.get('name', 'User')}")
 
         try:
+            # STEPS 1-3, with the LLM call already running alongside STEP 2
+            final_plan, insight_future = self._assemble_plan(user_profile, overlap_insight=True)
+
+            if "error" in final_plan:
+                return final_plan
+            # overlap_insight=True always starts the call for a successful plan
+            assert insight_future is not None
+
             # ---------------------------------------------------------
-            # STEP 1: Health Analysis (The Calculator)
+            # STEP 4: Collect AI Explanation (The Coach)
             # ---------------------------------------------------------
-            health_analysis = self.health_agent.analyze_user(user_profile)
+            if defer_insight:
+                # Caller renders the plan now and resolves the insight later
+                final_plan["ai_insight_future"] = insight_future
+            else:
+                final_plan["ai_insight"] = self.resolve_insight(final_plan, insight_future)
 
-            if not health_analysis:
-                return {"error": "Could not analyze health metrics. Check input data."}
+            logger.info("Plan generated successfully.")
+            return final_plan
 
-            targets = health_analysis["targets"]
-            target_calories = targets["calories"]
-            diet_pref = user_profile.get("diet_preference", "Veg")
+        except Exception as e:
+            logger.error(f"Error in generate_plan: {e}")
+            return {"error": UNEXPECTED_ERROR}
 
-            # ---------------------------------------------------------
-            # STEP 2: Generate 7-Day Meal Plan (The Chef)
-            # ---------------------------------------------------------
-            weekly_plan = {}
+    def resolve_insight(self, final_plan: FinalPlan,
+                        insight_future: Optional[Future] = None) -> str:
+        """
+        AI explanation for a plan, waiting at most INSIGHT_TIMEOUT.
 
-            for day in range(1, 8):
-                day_label = f"Day {day}"
+        Args:
+            final_plan (dict): A successful generate_plan result.
+            insight_future (Future): Its "ai_insight_future", if the call is
+                already running; otherwise a new call is submitted.
 
-                daily_meals = self.nutrition_agent.recommend_meal_plan(
-                    diet_preference=diet_pref,
-                    total_calories=target_calories
-                )
+        Returns:
+            str: The explanation, or INSIGHT_UNAVAILABLE if the LLM step fails.
+        """
+        if insight_future is None:
+            insight_future = _LLM_POOL.submit(
+                self.llm_agent.explain_plan,
+                {},
+                final_plan["user_profile"],
+                final_plan["nutritional_targets"]
+            )
 
-                if "error" in daily_meals:
-                    return {"error": daily_meals["error"]}
+        # A failed insight degrades to a notice instead of failing the whole plan
+        try:
+            return insight_future.result(timeout=INSIGHT_TIMEOUT)
+        except FutureTimeout:
+            logger.error("AI insight timed out; returning plan without it.")
+            insight_future.cancel()
+        except Exception as e:
+            logger.error(f"AI insight failed; returning plan without it: {e}")
+        return INSIGHT_UNAVAILABLE
 
-                weekly_plan[day_label] = {
-                    "meals": daily_meals,
-                    "calories": sum(
-                        meal["total_calories"] for meal in daily_meals.values()
-                    ),
-                    "macros": self._aggregate_daily_macros(daily_meals)
-                }
+    def generate_plans(self, user_profiles: List[Dict[str, Any]],
+                       timeout: float = 5.0) -> List[FinalPlan]:
+        """
+        Batch version of generate_plan for many users.
 
-            # ---------------------------------------------------------
-            # STEP 3: Generate AI Explanation (The Coach)
-            # ---------------------------------------------------------
+        Meal plans are built per user, then all AI explanations are requested
+        in one concurrent batch where duplicate (goal, calories) pairs share a
+        single LLM call.
+
+        Args:
+            user_profiles (list): One user profile dict per user.
+            timeout (float): Per-request LLM timeout in seconds.
+
+        Returns:
+            list: One final plan (or {"error": ...}) per profile, in order.
+        """
+        logger.info(f"Generating plans for {len(user_profiles)} users")
+
+        plans = []
+        pending = []
+
+        for user_profile in user_profiles:
+            try:
+                final_plan, _ = self._assemble_plan(user_profile)
+            except Exception as e:
+                logger.error(f"Error in generate_plans: {e}")
+                final_plan = {"error": UNEXPECTED_ERROR}
+
+            plans.append(final_plan)
+            if "error" not in final_plan:
+                pending.append(final_plan)
+
+        if pending:
+            requests = [
+                (plan["weekly_plan"], plan["user_profile"], plan["nutritional_targets"])
+                for plan in pending
+            ]
+            try:
+                insights = self._explain_batch(requests, timeout)
+            except Exception as e:
+                logger.error(f"AI insight batch failed; returning plans without it: {e}")
+                insights = [INSIGHT_UNAVAILABLE] * len(pending)
+
+            for final_plan, ai_explanation in zip(pending, insights):
+                final_plan["ai_insight"] = ai_explanation
+
+        return plans
+
+    def _assemble_plan(self, user_profile: Dict[str, Any],
+                       overlap_insight: bool = False) -> Tuple[FinalPlan, Optional[Future]]:
+        """
+        STEPS 1-3 shared by generate_plan and generate_plans: health analysis,
+        the 7-day meal plan and the plan dict, without the AI explanation.
+
+        With `overlap_insight`, the LLM call is submitted right after STEP 1 and
+        its future returned alongside the plan; otherwise (and for error results)
+        the future is None.
+        """
+        # ---------------------------------------------------------
+        # STEP 1: Health Analysis (The Calculator)
+        # ---------------------------------------------------------
+        health_analysis = self.health_agent.analyze_user(user_profile)
+
+        if not health_analysis:
+            return {"error": HEALTH_ERROR}, None
+
+        targets = health_analysis["targets"]
+        target_calories = targets["calories"]
+        diet_pref = user_profile.get("diet_preference", "Veg")
+
+        insight_future = None
+        if overlap_insight:
+            # The insight prompt only uses the goal and TARGET calories (never the
+            # meals), so the LLM call starts now and overlaps with STEP 2
             # IMPORTANT: Pass `targets` so the LLM sees the REAL calorie goal
-            ai_explanation = self.llm_agent.explain_plan(
-                weekly_plan,
+            insight_future = _LLM_POOL.submit(
+                self.llm_agent.explain_plan,
+                {},
                 user_profile,
                 targets
             )
 
-            # ---------------------------------------------------------
-            # STEP 4: Construct Final Response
-            # ---------------------------------------------------------
-            final_plan = {
-                "user_profile": user_profile,
-                "biometrics": health_analysis["biometrics"],
-                "nutritional_targets": targets,
-                "weekly_plan": weekly_plan,
-                "ai_insight": ai_explanation
-            }
+        # ---------------------------------------------------------
+        # STEP 2: Generate 7-Day Meal Plan (The Chef)
+        # ---------------------------------------------------------
+        weekly_plan = self._build_week(diet_pref, target_calories)
 
-            logger.info("Plan generated successfully.")
-            return final_plan
+        if "error" in weekly_plan:
+            if insight_future is not None:
+                insight_future.cancel()
+            return {"error": weekly_plan["error"]}, None
 
-        except Exception as e:
-            logger.error(f"Error in generate_plan: {e}")
-            return {"error": "An unexpected error occurred while generating your plan."}
+        # ---------------------------------------------------------
+        # STEP 3: Construct Final Response
+        # ---------------------------------------------------------
+        final_plan: FinalPlan = {
+            "user_profile": user_profile,
+            "biometrics": health_analysis["biometrics"],
+            "nutritional_targets": targets,
+            "weekly_plan": weekly_plan
+        }
+        return final_plan, insight_future
+
+    def _explain_batch(self, requests: List[Tuple[dict, dict, dict]],
+                       timeout: float) -> List[str]:
+        """
+        Runs LLMAgent.explain_plans_batch on the shared batch loop and waits for it.
+        The wait is bounded by one `timeout` per round of LLM_WORKERS unique calls,
+        so it also works (blocking) when called from inside another event loop.
+        """
+        rounds = -(-len(requests) // LLM_WORKERS)
+        future = asyncio.run_coroutine_threadsafe(
+            self.llm_agent.explain_plans_batch(requests, timeout, max_concurrency=LLM_WORKERS),
+            _llm_loop()
+        )
+        try:
+            return future.result(timeout=rounds * timeout + 1.0)
+        except FutureTimeout:
+            future.cancel()
+            raise
 
-    def _aggregate_daily_macros(self, daily_meals: Dict) -> Dict[str, float]:
+    def _build_week(self, diet_pref: str, target_calories: float) -> Dict[str, Any]:
         """
-        Helper to sum up protein/carbs/fats for the whole day.
+        Runs the Nutrition Agent once per day.
+        Returns the weekly plan keyed by DAY_LABELS, or {"error": ...}.
         """
+        weekly_plan = {}
+
+        # Bound once; the loop below calls them once per day
+        recommend_meal_plan = self.nutrition_agent.recommend_meal_plan
+        summarize_day = self._summarize_day
+
+        for day_label in DAY_LABELS:
+            daily_meals = recommend_meal_plan(
+                diet_preference=diet_pref,
+                total_calories=target_calories
+            )
+
+            if "error" in daily_meals:
+                return {"error": daily_meals["error"]}
+
+            # Display strings formatted once here, not on every UI render
+            for meal in daily_meals.values():
+                if "macro_summary" in meal:
+                    meal["display"] = {
+                        key: f"{int(value)}g"
+                        for key, value in meal["macro_summary"].items()
+                    }
+
+            day_calories, day_macros = summarize_day(daily_meals)
+
+            weekly_plan[day_label] = {
+                "meals": daily_meals,
+                "calories": day_calories,
+                "macros": day_macros
+            }
+
+        return weekly_plan
+
+    def _summarize_day(self, daily_meals: Dict) -> Tuple[int, Dict[str, float]]:
+        """
+        Helper to sum up calories and protein/carbs/fats for the whole day
+        in a single pass over the meals.
+        """
+        total_cal = 0
         total_p = 0
         total_c = 0
         total_f = 0
 
         for meal in daily_meals.values():
-            macros = meal.get("macro_summary", {})
+            total_cal += meal["total_calories"]
+            macros = meal.get("macro_summary", _EMPTY_MACROS)
             total_p += macros.get("protein", 0)
             total_c += macros.get("carbs", 0)
             total_f += macros.get("fats", 0)
 
-        return {
+        return total_cal, {
             "protein": round(total_p, 1),
             "carbs": round(total_c, 1),
             "fats": round(total_f, 1)
         }
+
+
+# -------------------------------------------------------------
+# PROCESS-WIDE ENGINE
+# -------------------------------------------------------------
+_ENGINE: Optional[RecommendationEngine] = None
+_ENGINE_LOCK = threading.Lock()
+
+
+def get_recommendation_engine() -> RecommendationEngine:
+    """
+    Returns the shared engine, building it on first use.
+    The dataset is loaded once per process, however many callers ask for it.
+    """
+    global _ENGINE
+    if _ENGINE is None:
+        with _ENGINE_LOCK:
+            if _ENGINE is None:
+                _ENGINE = RecommendationEngine()
+    return _ENGINE